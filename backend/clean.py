@@ -1,46 +1,42 @@
 # backend/cleanup_duplicates.py
 from services import SessionLocal, Result
-import json
+from sqlalchemy import delete, func, select
 
-def make_user_key(u):
-    if not u:
-        return ""
-    if isinstance(u, str):
-        try:
-            u = json.loads(u)
-        except Exception:
-            return u.strip().lower()
-    if isinstance(u, dict):
-        return (u.get("email") or u.get("name") or u.get("raw") or "").strip().lower()
-    return str(u).strip().lower()
+DELETE_CHUNK_SIZE = 1000  # stay well under driver bound-parameter limits
+FETCH_CHUNK_SIZE = 5000
+
+def chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def duplicate_ids_query():
+    """
+    Ids of every result that repeats an earlier one (same quiz, user, score/total, timestamp).
+    The lowest id in each group is kept; ranking happens in the DB via ROW_NUMBER().
+    """
+    rn = func.row_number().over(
+        partition_by=(Result.quiz_id, Result.user_key, Result.score, Result.total, Result.created_at),
+        order_by=Result.id.asc(),
+    )
+    ranked = select(Result.id, rn.label("rn")).subquery()
+    return select(ranked.c.id).where(ranked.c.rn > 1).order_by(ranked.c.id)
 
 def cleanup():
     session = SessionLocal()
     try:
-        # fetch all results ordered oldest->newest so we keep the earliest or latest as you prefer
-        rows = session.query(Result).order_by(Result.created_at.asc(), Result.id.asc()).all()
-        seen = set()
-        to_delete_ids = []
-
-        for r in rows:
-            uname = make_user_key(r.user)
-            created_iso = r.created_at.isoformat() if r.created_at else ""
-            key = f"{r.quiz_id}|{uname}|{r.score}|{r.total}|{created_iso}"
-            if key in seen:
-                to_delete_ids.append(r.id)
-            else:
-                seen.add(key)
+        # stream ids in batches rather than buffering the whole result set
+        stmt = duplicate_ids_query().execution_options(yield_per=FETCH_CHUNK_SIZE)
+        to_delete_ids = list(session.execute(stmt).scalars())
 
         if not to_delete_ids:
             print("No duplicate results found.")
             return
 
         print(f"Found {len(to_delete_ids)} duplicate result(s). Deleting...")
-        for rid in to_delete_ids:
-            row = session.query(Result).filter(Result.id == rid).first()
-            if row:
-                session.delete(row)
-        session.commit()
+        # commit per chunk: short transactions, write lock released between batches
+        for chunk in chunks(to_delete_ids, DELETE_CHUNK_SIZE):
+            session.execute(delete(Result).where(Result.id.in_(chunk)))
+            session.commit()
         print("Duplicates removed:", to_delete_ids)
     finally:
         session.close()
@@ -1,19 +1,15 @@
 # backend/main.py
+import asyncio
+
 from dotenv import load_dotenv
 load_dotenv()
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from services import init_db
-from routes import router as api_router
-
-# optional: google genai import left as-is (ok if not configured)
-try:
-    from google import genai
-except Exception:
-    genai = None
+from services import executor, init_db, get_genai_client
+from routes import router as api_router, ORJSONResponse
 
-app = FastAPI(title="Quiz Web - Python Backend (compact)")
+app = FastAPI(title="Quiz Web - Python Backend (compact)", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,14 +24,15 @@ app.include_router(api_router, prefix="/api")
 
 @app.on_event("startup")
 async def startup_event():
+    # asyncio.to_thread() uses the loop's default executor: point it at the shared, env-sized pool
+    asyncio.get_running_loop().set_default_executor(executor)
     # initialize DB (creates tables if missing)
     init_db()
-    # optional: check GenAI client availability
-    if genai:
-        try:
-            _ = genai.Client()
-        except Exception as e:
-            print("GenAI client init failed (ok if not configured):", e)
+    # optional: check GenAI client availability (also warms the shared client for the first upload)
+    try:
+        get_genai_client()
+    except Exception as e:
+        print("GenAI client init failed (ok if not configured):", e)
 
 @app.get("/")
 async def root():
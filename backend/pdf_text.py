@@ -0,0 +1,69 @@
+# backend/pdf_text.py
+# PDF text extraction helpers. Deliberately imports nothing from the app (DB, pydantic, genai):
+# this is the module spawned PDF pool workers import, so it must stay cheap to load.
+import io
+from typing import List, Optional, Union
+
+from PyPDF2 import PdfReader
+
+# optional PyMuPDF: C-implemented PDF parser, much faster text extraction than PyPDF2
+try:
+    import pymupdf
+except Exception:
+    pymupdf = None
+
+# str -> path on disk, bytes -> in-memory document
+PdfSource = Union[str, bytes]
+
+def open_pdf(src: PdfSource):
+    """
+    Parsed document: a PyMuPDF Document when available, else a PyPDF2 PdfReader.
+    Release it with close_pdf().
+    """
+    if pymupdf is not None:
+        if isinstance(src, bytes):
+            return pymupdf.open(stream=src, filetype="pdf")
+        return pymupdf.open(src)
+    return PdfReader(io.BytesIO(src) if isinstance(src, bytes) else src)
+
+def close_pdf(doc) -> None:
+    if not isinstance(doc, PdfReader):
+        doc.close()
+
+def page_count(doc) -> int:
+    if isinstance(doc, PdfReader):
+        return len(doc.pages)
+    return doc.page_count
+
+def page_texts(doc, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """
+    Non-empty text of pages [start, stop) (stop=None: through the last page) of an open
+    document; pages that fail to extract are skipped.
+    """
+    if isinstance(doc, PdfReader):
+        pages = doc.pages[start:stop]
+        extract = lambda page: page.extract_text()
+    else:
+        pages = (doc[i] for i in range(start, doc.page_count if stop is None else stop))
+        extract = lambda page: page.get_text("text")
+
+    text_parts = []
+    for page in pages:
+        try:
+            ptext = extract(page)
+            if ptext:
+                text_parts.append(ptext)
+        except Exception:
+            continue
+    return text_parts
+
+def extract_page_range(src: PdfSource, start: int, stop: int) -> List[str]:
+    """
+    Pool worker entry point: opens its own copy of the document, since parsed documents
+    can't be shared across processes.
+    """
+    doc = open_pdf(src)
+    try:
+        return page_texts(doc, start, stop)
+    finally:
+        close_pdf(doc)
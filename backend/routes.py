@@ -1,67 +1,173 @@
 # backend/routes.py
-import json
+import hashlib
 import asyncio
+import tempfile
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, UploadFile, File, HTTPException
+from fastapi.responses import JSONResponse, Response
 import aiofiles
+import orjson
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
 from pydantic import ValidationError
 
 from services import (
-    UPLOAD_DIR, QUESTIONS_FILE, executor,
+    UPLOAD_DIR, QUESTIONS_FILE,
     extract_text_from_pdf_sync, generate_questions_from_text,
-    save_questions_and_db_async, SessionLocal, Quiz, func,
+    save_questions_and_db_async, SessionLocal, get_db, Quiz, func, quiz_title_filter,
     save_result_sync, get_latest_result_sync, Result
 )
 
 router = APIRouter()
 
-# ---- /quizzes (list + delete) ----
-@router.get("/quizzes")
-async def list_quizzes(limit: int = 50, offset: int = 0, q: Optional[str] = None):
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson (C extension, several times faster than stdlib json).
+    Also used as the app's default_response_class in main.py.
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# uploads up to this size are parsed from memory, larger ones streamed to disk first; either way
+# extract_text_from_pdf_sync picks serial vs parallel extraction by page count.
+# Matches Starlette's multipart spool limit: bigger file parts already sit in a temp file, so
+# reading them whole would only add a full in-memory copy per concurrent upload.
+IN_MEMORY_UPLOAD_MAX_BYTES = 1 << 20  # 1 MiB
+
+def _discard_upload(path: Optional[Path]) -> None:
+    if path is None:
+        return
+    try:
+        path.unlink(missing_ok=True)
+    except Exception:
+        pass
+
+def _answer_key(questions: List[Dict[str, Any]]) -> List[tuple]:
+    """
+    (correct, correct_normalized) per question, computed once per quiz instead of per submit.
+    """
+    out = []
+    for q in questions:
+        correct = str(q.get("correct_answer", "")).strip()
+        out.append((correct, correct.lower()))
+    return out
+
+def _quiz_fingerprint(quiz_id: int) -> Optional[str]:
+    """
+    Current questions fingerprint of a stored quiz (primary-key lookup, the JSON is not read).
+    Raises LookupError if the quiz does not exist.
+
+    The per-quiz caches below are per-process and keyed on (quiz_id, fingerprint): SQLite
+    reuses the highest id after a delete, and with several uvicorn workers only the worker
+    that served the DELETE clears its caches, so the id alone can't identify a cached entry.
+    """
     session = SessionLocal()
     try:
-        query = session.query(Quiz)
-        if q:
-            like_term = f"%{q.lower()}%"
-            query = query.filter(func.lower(Quiz.title).like(like_term))
-        rows = query.order_by(Quiz.created_at.desc()).limit(limit).offset(offset).all()
-
-        result = []
-        for r in rows:
-            try:
-                qcount = len(r.questions) if isinstance(r.questions, list) else 0
-            except Exception:
-                qcount = 0
-            result.append({
-                "id": r.id,
-                "title": r.title,
-                "created_at": r.created_at.isoformat() if r.created_at else None,
-                "question_count": qcount
-            })
-        return JSONResponse({"quizzes": result})
+        row = session.query(Quiz.fingerprint).filter(Quiz.id == quiz_id).first()
     finally:
         session.close()
+    if row is None:
+        raise LookupError(quiz_id)
+    return row.fingerprint
 
-@router.delete("/quizzes/{quiz_id}")
-async def delete_quiz(quiz_id: int):
+@lru_cache(maxsize=512)
+def _quiz_answer_key(quiz_id: int, fingerprint: Optional[str]):
+    """
+    Questions + answer key for a stored quiz; call with _quiz_fingerprint(quiz_id) so entries
+    for a deleted quiz are never served under a reused id. Raises LookupError if the quiz does
+    not exist (misses are not cached).
+    """
+    session = SessionLocal()
+    try:
+        row = session.query(Quiz.questions).filter(Quiz.id == quiz_id).first()
+        if row is None:
+            raise LookupError(quiz_id)
+        return row.questions, _answer_key(row.questions)
+    finally:
+        session.close()
+
+@lru_cache(maxsize=256)
+def _quiz_questions_body(quiz_id: int, fingerprint: Optional[str]) -> Tuple[bytes, str]:
+    """
+    Serialized /questions?quiz_id= response body and its ETag; keyed like _quiz_answer_key
+    (per-process, validated by fingerprint). Raises LookupError if the quiz does not exist
+    (misses are not cached).
+    """
     session = SessionLocal()
     try:
-        q = session.query(Quiz).filter(Quiz.id == quiz_id).first()
-        if not q:
-            return JSONResponse(status_code=404, content={"detail": "Quiz not found"})
-        # optionally remove related results:
-        session.query(Result).filter(Result.quiz_id == quiz_id).delete()
-        session.delete(q)
+        row = session.query(Quiz.questions).filter(Quiz.id == quiz_id).first()
+        if row is None:
+            raise LookupError(quiz_id)
+        content = {"message": "Quiz fetched", "quiz_id": quiz_id, "questions": row.questions}
+    finally:
+        session.close()
+    body = orjson.dumps(content)
+    return body, f'"{hashlib.sha256(body, usedforsecurity=False).hexdigest()}"'
+
+# (st_mtime_ns, parsed questions.json)
+_questions_file_cache: Optional[Tuple[int, Any]] = None
+
+async def _load_questions_file():
+    """
+    Parsed questions.json, re-read only when its mtime changes. Returns None if the
+    file does not exist; raises if it is malformed.
+    """
+    global _questions_file_cache
+    try:
+        mtime = QUESTIONS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _questions_file_cache is not None and _questions_file_cache[0] == mtime:
+        return _questions_file_cache[1]
+    async with aiofiles.open(QUESTIONS_FILE, "rb") as f:
+        data = orjson.loads(await f.read())
+    _questions_file_cache = (mtime, data)
+    return data
+
+def _invalidate_quiz_caches():
+    # frees this worker's entries early; correctness comes from the fingerprint in the keys
+    _quiz_answer_key.cache_clear()
+    _quiz_questions_body.cache_clear()
+
+# ---- /quizzes (list + delete) ----
+@router.get("/quizzes")
+async def list_quizzes(limit: int = 50, offset: int = 0, q: Optional[str] = None, session: Session = Depends(get_db)):
+    # select only the listing columns; the questions JSON is never fetched here
+    query = session.query(Quiz.id, Quiz.title, Quiz.created_at, Quiz.question_count)
+    if q:
+        query = query.filter(quiz_title_filter(q))
+    rows = query.order_by(Quiz.created_at.desc()).limit(limit).offset(offset).all()
+
+    result = []
+    for r in rows:
+        result.append({
+            "id": r.id,
+            "title": r.title,
+            "created_at": r.created_at,  # datetime serialized by orjson
+            "question_count": r.question_count or 0
+        })
+    return ORJSONResponse({"quizzes": result})
+
+@router.delete("/quizzes/{quiz_id}")
+async def delete_quiz(quiz_id: int, session: Session = Depends(get_db)):
+    try:
+        # delete directly and use rowcount for the 404 (no SELECT + ORM load first)
+        res = session.execute(delete(Quiz).where(Quiz.id == quiz_id))
+        if res.rowcount == 0:
+            session.rollback()
+            return ORJSONResponse(status_code=404, content={"detail": "Quiz not found"})
+        # optionally remove related results (same transaction):
+        session.execute(delete(Result).where(Result.quiz_id == quiz_id))
         session.commit()
-        return JSONResponse({"deleted": quiz_id})
+        _invalidate_quiz_caches()
+        return ORJSONResponse({"deleted": quiz_id})
     except Exception as e:
         session.rollback()
-        return JSONResponse(status_code=500, content={"detail": str(e)})
-    finally:
-        session.close()
+        return ORJSONResponse(status_code=500, content={"detail": str(e)})
 
 # ---- /upload ----
 @router.post("/upload")
@@ -69,40 +175,38 @@ async def upload_pdf(file: UploadFile = File(...)):
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are allowed.")
 
-    saved_path = UPLOAD_DIR / file.filename
-    counter = 1
-    base = saved_path.stem
-    suffix = saved_path.suffix
-    while saved_path.exists():
-        saved_path = UPLOAD_DIR / f"{base}_{counter}{suffix}"
-        counter += 1
+    saved_path: Optional[Path] = None
+    if file.size is not None and file.size <= IN_MEMORY_UPLOAD_MAX_BYTES:
+        # small upload: still in Starlette's in-memory spool, parse it from there without a disk copy
+        source = await file.read()
+    else:
+        # unique name in one step instead of probing name_1, name_2, ... with exists()
+        orig = Path(file.filename)
+        with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=f"{orig.stem}_", suffix=orig.suffix, delete=False) as tmp:
+            saved_path = Path(tmp.name)
 
-    try:
-        async with aiofiles.open(saved_path, "wb") as out_file:
-            content = await file.read()
-            await out_file.write(content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save upload: {e}")
+        try:
+            # stream to disk in chunks so memory stays flat regardless of PDF size
+            async with aiofiles.open(saved_path, "wb") as out_file:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await out_file.write(chunk)
+        except Exception as e:
+            _discard_upload(saved_path)
+            raise HTTPException(status_code=500, detail=f"Failed to save upload: {e}")
+        source = saved_path
 
     try:
-        loop = asyncio.get_event_loop()
-        extracted_text = await loop.run_in_executor(executor, extract_text_from_pdf_sync, saved_path)
+        extracted_text = await asyncio.to_thread(extract_text_from_pdf_sync, source)
 
         if not extracted_text or len(extracted_text.strip()) == 0:
-            try:
-                saved_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+            _discard_upload(saved_path)
             raise HTTPException(status_code=500, detail="No text extracted from PDF")
 
         gen_result = await generate_questions_from_text(extracted_text, max_questions=10)
         questions = gen_result.get("data", [])
 
         if not questions:
-            try:
-                saved_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+            _discard_upload(saved_path)
             raise HTTPException(status_code=500, detail="No questions generated")
 
         try:
@@ -114,94 +218,60 @@ async def upload_pdf(file: UploadFile = File(...)):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-        try:
-            saved_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+        _discard_upload(saved_path)
 
-        return JSONResponse({"message": "File processed and questions generated successfully", "questions": [q.dict() for q in quiz_out.questions], "quiz_id": quiz_out.id})
+        return ORJSONResponse({"message": "File processed and questions generated successfully", "questions": [q.model_dump() for q in quiz_out.questions], "quiz_id": quiz_out.id})
 
     except HTTPException:
         raise
     except Exception as e:
-        try:
-            saved_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+        _discard_upload(saved_path)
         raise HTTPException(status_code=500, detail=str(e))
 
 # ---- /questions & /submit ----
 @router.get("/questions")
-async def get_questions(quiz_id: Optional[int] = None):
+async def get_questions(request: Request, quiz_id: Optional[int] = None):
     if quiz_id is not None:
-        session = SessionLocal()
-        try:
-            q = session.query(Quiz).filter(Quiz.id == quiz_id).first()
-            if not q:
-                return JSONResponse(status_code=404, content={"message": "Quiz not found"})
-            return JSONResponse({"message": "Quiz fetched", "quiz_id": q.id, "questions": q.questions})
-        finally:
-            session.close()
-
-    if QUESTIONS_FILE.exists():
-        async with aiofiles.open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
-            content = await f.read()
         try:
-            data = json.loads(content)
-            if not isinstance(data, list) or len(data) == 0:
-                return JSONResponse(status_code=400, content={"message": "No questions available"})
-            return JSONResponse({"message": "File processed and questions generated successfully", "questions": data})
-        except Exception:
-            return JSONResponse(status_code=500, content={"message": "questions.json malformed"})
-    else:
-        return JSONResponse(status_code=400, content={"message": "No questions available"})
-
-@router.post("/submit")
-async def submit_answers(payload: Dict[str, Any]):
-    answers = payload.get("answers")
-    quiz_id = payload.get("quiz_id")  # optional
-    user = payload.get("user")        # optional user info sent from frontend
-
-    if not isinstance(answers, (dict, list)):
-        raise HTTPException(status_code=400, detail="Invalid answers format")
-
-    # load questions: prefer quiz_id from DB, else questions.json
-    questions_data = None
-    if quiz_id:
-        session = SessionLocal()
-        try:
-            q = session.query(Quiz).filter(Quiz.id == quiz_id).first()
-            if not q:
-                raise HTTPException(status_code=400, detail="Quiz not found")
-            questions_data = q.questions
-        finally:
-            session.close()
-    else:
-        if not QUESTIONS_FILE.exists():
-            raise HTTPException(status_code=400, detail="No questions available to grade")
-        async with aiofiles.open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
-            content = await f.read()
-        questions_data = json.loads(content)
+            body, etag = _quiz_questions_body(quiz_id, _quiz_fingerprint(quiz_id))
+        except LookupError:
+            return ORJSONResponse(status_code=404, content={"message": "Quiz not found"})
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
+    try:
+        data = await _load_questions_file()
+    except Exception:
+        return ORJSONResponse(status_code=500, content={"message": "questions.json malformed"})
+    if not isinstance(data, list) or len(data) == 0:
+        return ORJSONResponse(status_code=400, content={"message": "No questions available"})
+    return ORJSONResponse({"message": "File processed and questions generated successfully", "questions": data})
+
+def _grade(questions_data: List[Dict[str, Any]], answer_key: List[tuple], answers) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Grade submitted answers (list or {index: answer} dict). Returns (score, detailed).
+    """
     score = 0
     detailed: List[Dict[str, Any]] = []
-    total_questions = len(questions_data)
 
-    for idx, q in enumerate(questions_data):
-        userAns = ""
+    # pick the answer accessor once instead of branching per question
+    if isinstance(answers, list):
+        def user_answer(idx):
+            return (answers[idx] or "").strip()
+    else:
+        # accept either string keys or numeric keys
+        def user_answer(idx):
+            return str(answers.get(str(idx), answers.get(idx, ""))).strip()
+
+    for idx, (q, (correct, correct_norm)) in enumerate(zip(questions_data, answer_key)):
         try:
-            if isinstance(answers, list):
-                userAns = (answers[idx] or "").strip()
-            else:
-                # accept either string keys or numeric keys
-                userAns = str(answers.get(str(idx), answers.get(idx, ""))).strip()
+            userAns = user_answer(idx)
         except Exception:
             userAns = ""
 
         # Normalize comparison for grading (case-insensitive)
-        userAns_norm = userAns.strip().lower() if isinstance(userAns, str) else ""
-        correct = str(q.get("correct_answer", "")).strip()
-        correct_norm = correct.lower()
+        userAns_norm = userAns.lower()
 
         is_correct = False
         if userAns_norm == "skipped question" or userAns == "":
@@ -222,10 +292,16 @@ async def submit_answers(payload: Dict[str, Any]):
             "explanation": q.get("explanation", "") if isinstance(q, dict) else ""
         })
 
-    # persist result to DB using executor (sync function)
+    return score, detailed
+
+def _grade_and_save(questions_data, answer_key, answers, quiz_id, user):
+    """
+    Runs in the executor: grade, then persist the result. Returns (score, total, detailed, saved).
+    """
+    score, detailed = _grade(questions_data, answer_key, answers)
+    total_questions = len(questions_data)
     try:
-        loop = asyncio.get_event_loop()
-        saved = await loop.run_in_executor(executor, save_result_sync, quiz_id, score, total_questions, detailed, user)
+        saved = save_result_sync(quiz_id, score, total_questions, detailed, user)
     except Exception as e:
         # If saving fails, still return the computed result (so frontend is not blocked)
         saved = {
@@ -234,6 +310,34 @@ async def submit_answers(payload: Dict[str, Any]):
             "detailed": detailed,
             "error_saving": str(e)
         }
+    return score, total_questions, detailed, saved
+
+@router.post("/submit")
+async def submit_answers(payload: Dict[str, Any]):
+    answers = payload.get("answers")
+    quiz_id = payload.get("quiz_id")  # optional
+    user = payload.get("user")        # optional user info sent from frontend
+
+    if not isinstance(answers, (dict, list)):
+        raise HTTPException(status_code=400, detail="Invalid answers format")
+
+    # load questions: prefer quiz_id from DB, else questions.json
+    questions_data = None
+    if quiz_id:
+        try:
+            questions_data, answer_key = _quiz_answer_key(quiz_id, _quiz_fingerprint(quiz_id))
+        except LookupError:
+            raise HTTPException(status_code=400, detail="Quiz not found")
+    else:
+        questions_data = await _load_questions_file()
+        if questions_data is None:
+            raise HTTPException(status_code=400, detail="No questions available to grade")
+        answer_key = _answer_key(questions_data)
+
+    # grade + persist in one executor hop so the event loop stays free
+    score, total_questions, detailed, saved = await asyncio.to_thread(
+        _grade_and_save, questions_data, answer_key, answers, quiz_id, user
+    )
 
     # return the saved result (or computed if saving failed)
     response_payload = {
@@ -242,7 +346,7 @@ async def submit_answers(payload: Dict[str, Any]):
         "detailed": detailed,
         "saved_result": saved
     }
-    return JSONResponse(response_payload)
+    return ORJSONResponse(response_payload)
 
 # ---- /results/latest ----
 @router.get("/results/latest")
@@ -250,86 +354,73 @@ async def get_latest_result():
     """
     Return the most recent quiz result attempt (if any).
     """
-    loop = asyncio.get_event_loop()
     try:
-        latest = await loop.run_in_executor(executor, get_latest_result_sync)
+        latest = await asyncio.to_thread(get_latest_result_sync)
         if not latest:
-            return JSONResponse(status_code=404, content={"message": "No results found"})
-        return JSONResponse(latest)
+            return ORJSONResponse(status_code=404, content={"message": "No results found"})
+        return ORJSONResponse(latest)
     except Exception as e:
-        return JSONResponse(status_code=500, content={"message": f"Failed to fetch latest result: {e}"})
+        return ORJSONResponse(status_code=500, content={"message": f"Failed to fetch latest result: {e}"})
 
 # ---- list results endpoint for admin ----
 @router.get("/results")
-async def list_results(quiz_id: Optional[int] = None, limit: int = 100, offset: int = 0):
+async def list_results(quiz_id: Optional[int] = None, limit: int = 100, offset: int = 0, session: Session = Depends(get_db)):
     """
     Return a list of saved results (attempts). Optional: filter by quiz_id.
     This endpoint deduplicates attempts by a composed key so repeated identical attempts
     (same quiz, same user identifier, same score/total, same timestamp) won't appear multiple times.
+    Deduplication happens in SQL before limit/offset, so each page is full.
     """
-    session = SessionLocal()
-    try:
-        query = session.query(Result)
-        if quiz_id is not None:
-            query = query.filter(Result.quiz_id == quiz_id)
-
-        # order by newest first, include id as tiebreaker
-        rows = query.order_by(Result.created_at.desc(), Result.id.desc()).limit(limit).offset(offset).all()
-
-        out = []
-        seen_keys = set()
-        for r in rows:
-            # parse user field defensively (it may already be a dict or a JSON string)
-            user_obj = r.user
-            if isinstance(user_obj, str):
-                try:
-                    user_obj = json.loads(user_obj)
-                except Exception:
-                    user_obj = {"raw": user_obj}
-
-            uname = ""
-            if isinstance(user_obj, dict):
-                uname = (user_obj.get("email") or user_obj.get("name") or user_obj.get("raw") or "").strip().lower()
-
-            # create a dedupe key
-            created_iso = r.created_at.isoformat() if r.created_at else ""
-            dedupe_key = f"{r.quiz_id}|{uname}|{r.score}|{r.total}|{created_iso}"
-
-            if dedupe_key in seen_keys:
-                # skip duplicate attempt
-                continue
-            seen_keys.add(dedupe_key)
-
-            out.append({
-                "id": r.id,
-                "quiz_id": r.quiz_id,
-                "score": r.score,
-                "total": r.total,
-                "answers": r.answers,
-                "user": user_obj,
-                "created_at": created_iso
-            })
-
-        return JSONResponse({"results": out})
-    finally:
-        session.close()
+    # rank identical attempts, newest id first; rn == 1 is the one we keep
+    rn = func.row_number().over(
+        partition_by=(Result.quiz_id, Result.user_key, Result.score, Result.total, Result.created_at),
+        order_by=Result.id.desc(),
+    )
+    ranked = session.query(Result.id, rn.label("rn"))
+    if quiz_id is not None:
+        ranked = ranked.filter(Result.quiz_id == quiz_id)
+    ranked = ranked.subquery()
+
+    query = session.query(Result).join(ranked, Result.id == ranked.c.id).filter(ranked.c.rn == 1)
+
+    # order by newest first, include id as tiebreaker
+    rows = query.order_by(Result.created_at.desc(), Result.id.desc()).limit(limit).offset(offset).all()
+
+    out = []
+    for r in rows:
+        # parse user field defensively (it may already be a dict or a JSON string)
+        user_obj = r.user
+        if isinstance(user_obj, str):
+            try:
+                user_obj = orjson.loads(user_obj)
+            except Exception:
+                user_obj = {"raw": user_obj}
+
+        out.append({
+            "id": r.id,
+            "quiz_id": r.quiz_id,
+            "score": r.score,
+            "total": r.total,
+            "answers": r.answers,
+            "user": user_obj,
+            "created_at": r.created_at  # datetime serialized by orjson
+        })
+
+    return ORJSONResponse({"results": out})
 
 # ---- delete a single result (admin) ----
 @router.delete("/results/{result_id}")
-async def delete_result(result_id: int):
+async def delete_result(result_id: int, session: Session = Depends(get_db)):
     """
     Delete a single result row by id.
     """
-    session = SessionLocal()
     try:
-        r = session.query(Result).filter(Result.id == result_id).first()
-        if not r:
-            return JSONResponse(status_code=404, content={"detail": "Result not found"})
-        session.delete(r)
+        res = session.execute(delete(Result).where(Result.id == result_id))
+        if res.rowcount == 0:
+            session.rollback()
+            return ORJSONResponse(status_code=404, content={"detail": "Result not found"})
         session.commit()
-        return JSONResponse({"deleted_result": result_id})
+        return ORJSONResponse({"deleted_result": result_id})
     except Exception as e:
         session.rollback()
-        return JSONResponse(status_code=500, content={"detail": str(e)})
-    finally:
-        session.close()
\ No newline at end of file
+        return ORJSONResponse(status_code=500, content={"detail": str(e)})
\ No newline at end of file
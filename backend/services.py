@@ -1,24 +1,30 @@
 # backend/services.py
+import asyncio
 import hashlib
-import json
-import shutil
+import multiprocessing
+import os
 import re
+import threading
 import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Generator, List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # third-party
 import aiofiles
-from PyPDF2 import PdfReader
+import orjson
 
 # SQLAlchemy
-from sqlalchemy import Column, Integer, String, DateTime, create_engine, func
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import Column, Integer, String, DateTime, Index, MetaData, Table, and_, case, create_engine, event, func, insert, inspect, or_, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from sqlalchemy.types import JSON as SA_JSON
 
 # Pydantic
-from pydantic import BaseModel, Field, validator, ValidationError
+from pydantic import BaseModel, Field, ValidationError, ValidationInfo, field_validator
 
 # optional GenAI client
 try:
@@ -26,6 +32,9 @@ try:
 except Exception:
     genai = None
 
+# local
+from pdf_text import close_pdf, extract_page_range, open_pdf, page_count, page_texts
+
 # --- CONFIG / PATHS ---
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "uploads"
@@ -35,26 +44,36 @@ DB_FILE = BASE_DIR / "quizweb.db"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # --- Thread pool for blocking IO (shared) ---
-executor = ThreadPoolExecutor(max_workers=4)
+# main.py installs it as the event loop's default executor, so asyncio.to_thread() runs on it too.
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "16"))
+executor = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE)
+
+# --- Process pool for CPU-bound PDF text extraction (created on first large PDF) ---
+# Page extraction holds the GIL (PyMuPDF and PyPDF2 alike), so parallelism needs processes.
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+PDF_PARALLEL_MIN_PAGES = 64
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
 
 # ---------------------------
 # Pydantic models for validation
 # ---------------------------
 class QuestionSchema(BaseModel):
     question: str
-    options: List[str] = Field(..., min_items=4, max_items=4)
+    options: List[str] = Field(..., min_length=4, max_length=4)
     correct_answer: str
 
-    @validator("correct_answer")
-    def correct_must_be_in_options(cls, v, values):
-        opts = values.get("options", [])
+    @field_validator("correct_answer")
+    @classmethod
+    def correct_must_be_in_options(cls, v: str, info: ValidationInfo) -> str:
+        opts = info.data.get("options", [])
         if v not in opts:
             raise ValueError("correct_answer must exactly match one of the options")
         return v
 
 class QuizCreateSchema(BaseModel):
     title: Optional[str] = "Uploaded Quiz"
-    questions: List[QuestionSchema] = Field(..., min_items=1)
+    questions: List[QuestionSchema] = Field(..., min_length=1)
 
 class QuizOutSchema(BaseModel):
     id: int
@@ -72,7 +91,8 @@ class Quiz(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), default="Uploaded Quiz")
     questions = Column(SA_JSON, nullable=False)
-    fingerprint = Column(String(64), nullable=True, index=True)  # sha256 hex fingerprint for dedupe
+    fingerprint = Column(String(64), nullable=True, unique=True, index=True)  # sha256 hex fingerprint for dedupe
+    question_count = Column(Integer, nullable=True)  # len(questions), so listings never load the JSON
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 class Result(Base):
@@ -83,87 +103,321 @@ class Result(Base):
     total = Column(Integer, default=0)
     answers = Column(SA_JSON, nullable=True)  # stores "detailed" array
     user = Column(SA_JSON, nullable=True)     # stores user info (name/email)
+    user_key = Column(String(255), nullable=True)  # normalized user identifier (see make_user_key)
+    # sha256 of canonical answers / user JSON; matched within the ix_results_quiz_created range, so not indexed
+    answers_fingerprint = Column(String(64), nullable=True)
+    user_fingerprint = Column(String(64), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # supports duplicate detection in cleanup() and /results
+        Index("ix_results_dedupe", "quiz_id", "user_key", "score", "total", "created_at"),
+        # bounded range scan for the recent-duplicate check in save_result_sync
+        Index("ix_results_quiz_created", "quiz_id", "created_at"),
+    )
+
+class GenerationCache(Base):
+    __tablename__ = "generation_cache"
+    content_hash = Column(String(64), primary_key=True)  # sha256 hex of the extracted PDF text
+    max_questions = Column(Integer, primary_key=True)
+    data = Column(SA_JSON, nullable=False)               # normalized questions as returned to the caller
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+# SQL counterpart of make_user_key, used to backfill user_key on existing rows
+_user_key_sql = func.lower(func.trim(func.coalesce(
+    func.nullif(func.json_extract(Result.user, "$.email"), ""),
+    func.nullif(func.json_extract(Result.user, "$.name"), ""),
+    func.nullif(func.json_extract(Result.user, "$.raw"), ""),
+    "",
+)))
+
+# FTS5 trigram index over quiz titles (kept in sync by triggers), so the /quizzes substring
+# search can use an index instead of scanning lower(title) LIKE '%q%'. Lives outside Base.metadata.
+quiz_title_fts = Table(
+    "quizzes_title_fts", MetaData(),
+    Column("rowid", Integer),
+    Column("title", String),
+)
+_QUIZ_TITLE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE quizzes_title_fts USING fts5("
+    "title, content='quizzes', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER quizzes_title_fts_ai AFTER INSERT ON quizzes BEGIN "
+    "INSERT INTO quizzes_title_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER quizzes_title_fts_ad AFTER DELETE ON quizzes BEGIN "
+    "INSERT INTO quizzes_title_fts(quizzes_title_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER quizzes_title_fts_au AFTER UPDATE OF title ON quizzes BEGIN "
+    "INSERT INTO quizzes_title_fts(quizzes_title_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO quizzes_title_fts(rowid, title) VALUES (new.id, new.title); END",
+    "INSERT INTO quizzes_title_fts(quizzes_title_fts) VALUES ('rebuild')",
+)
+_title_fts_enabled = False
+
 DATABASE_URL = f"sqlite:///{DB_FILE}"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+if engine.url.database not in (None, "", ":memory:"):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _record):
+        # WAL: readers don't block the writer; NORMAL sync is safe under WAL and skips an fsync per commit
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        cur.execute("PRAGMA cache_size=-65536")    # 64 MiB
+        cur.close()
+# expire_on_commit=False: objects stay readable after commit without a refetch SELECT
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
+
+def get_db() -> Generator[Session, None, None]:
+    """
+    FastAPI dependency: one session per request, always closed afterwards.
+    """
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
 
 def init_db():
     """
-    Create tables. Call after removing old DB to apply model changes.
+    Create tables, then bring an existing DB up to date with the models
+    (create_all() never alters tables that already exist).
     """
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _make_quiz_fingerprint_unique(conn)
+        # single-column fingerprint indexes from earlier builds: never chosen by the planner, pure write cost
+        conn.execute(text("DROP INDEX IF EXISTS ix_results_answers_fingerprint"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_results_user_fingerprint"))
+        for table in Base.metadata.sorted_tables:
+            _add_missing_columns(conn, table)
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        conn.execute(update(Quiz).where(Quiz.question_count.is_(None)).values(question_count=func.json_array_length(Quiz.questions)))
+        conn.execute(update(Result).where(Result.user_key.is_(None)).values(user_key=_user_key_sql))
+    _init_title_fts()
+
+def _init_title_fts():
+    """
+    Create the quiz title FTS index on first run. Older SQLite builds without FTS5 or the
+    trigram tokenizer keep using the plain LIKE scan.
+    """
+    global _title_fts_enabled
+    if inspect(engine).has_table("quizzes_title_fts"):
+        _title_fts_enabled = True
+        return
+    try:
+        with engine.begin() as conn:
+            for ddl in _QUIZ_TITLE_FTS_DDL:
+                conn.execute(text(ddl))
+        _title_fts_enabled = True
+    except OperationalError as e:
+        print("Quiz title FTS index unavailable, using LIKE scan:", e)
+
+def quiz_title_filter(q: str):
+    """
+    Case-insensitive substring match on Quiz.title, served by the trigram index when available.
+    """
+    like_term = f"%{q.lower()}%"
+    if _title_fts_enabled:
+        return Quiz.id.in_(select(quiz_title_fts.c.rowid).where(quiz_title_fts.c.title.like(like_term)))
+    return func.lower(Quiz.title).like(like_term)
+
+def _make_quiz_fingerprint_unique(conn):
+    """
+    Older DBs have a non-unique ix_quizzes_fingerprint; drop it so it is recreated as UNIQUE.
+    Rows that duplicate an earlier fingerprint lose theirs (the earliest quiz keeps it).
+    """
+    for ix in inspect(conn).get_indexes("quizzes"):
+        if ix["name"] == "ix_quizzes_fingerprint" and not ix["unique"]:
+            conn.execute(text(
+                "UPDATE quizzes SET fingerprint = NULL WHERE fingerprint IS NOT NULL AND id NOT IN "
+                "(SELECT MIN(id) FROM quizzes WHERE fingerprint IS NOT NULL GROUP BY fingerprint)"
+            ))
+            conn.execute(text("DROP INDEX ix_quizzes_fingerprint"))
+
+def _add_missing_columns(conn, table):
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for col in table.columns:
+        if col.name not in existing:
+            coltype = col.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {coltype}"))
 
 # ---------------------------
 # PDF extraction (sync)
 # ---------------------------
-def extract_text_from_pdf_sync(path: Path) -> str:
-    reader = PdfReader(str(path))
-    text_parts = []
-    for page in reader.pages:
-        try:
-            ptext = page.extract_text()
-            if ptext:
-                text_parts.append(ptext)
-        except Exception:
-            continue
-    return "\n".join(text_parts)
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn: forking a multi-threaded server process is unsafe
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        # another thread may already have replaced it
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def extract_text_from_pdf_sync(src: Union[Path, bytes]) -> str:
+    """
+    Text of a PDF given as a path or as raw bytes (small uploads are kept in memory).
+    Serial vs parallel is decided by page count, not file size: text-heavy PDFs with
+    hundreds of pages are often only a few MiB.
+    """
+    src = src if isinstance(src, bytes) else str(src)
+    # one parse decides serial vs parallel and, when serial, is reused for the extraction
+    doc = open_pdf(src)
+    try:
+        n_pages = page_count(doc)
+        if PDF_WORKERS < 2 or n_pages < PDF_PARALLEL_MIN_PAGES:
+            return "\n".join(page_texts(doc))
+    finally:
+        close_pdf(doc)
+
+    # large PDF: split into one contiguous page range per worker, keep page order on join
+    # (bytes sources are pickled to each worker as-is)
+    step = -(-n_pages // PDF_WORKERS)
+    pool = _get_pdf_pool()
+    try:
+        futures = [pool.submit(extract_page_range, src, i, min(i + step, n_pages)) for i in range(0, n_pages, step)]
+        return "\n".join(t for f in futures for t in f.result())
+    except BrokenProcessPool:
+        # a worker died (OOM kill, MuPDF crash on a hostile upload): drop the pool so the next
+        # large PDF gets a fresh one, and finish this one in-process
+        _discard_pdf_pool(pool)
+        return "\n".join(extract_page_range(src, 0, n_pages))
 
 # ---------------------------
 # Clean & parse model output to JSON
 # ---------------------------
+# compiled once at import instead of on every call
+_RE_FENCE = re.compile(r"```(?:json)?")
+_RE_TRAILING_COMMA = re.compile(r",\s*([\]\}])")
+_RE_JSON_ARRAY = re.compile(r"(\[.*\])", re.DOTALL)
+# C0 + DEL + C1 control characters, removed with str.translate (no regex engine)
+_CTRL_CHARS_TABLE = dict.fromkeys([*range(0x00, 0x20), *range(0x7F, 0xA0)])
+
 def clean_and_parse_json_from_model(text: str):
     if text is None:
         raise ValueError("Model returned empty text")
 
-    cleaned = re.sub(r"```(?:json)?", "", text)
-    cleaned = re.sub(r"[\u0000-\u001F\u007F-\u009F]", "", cleaned)
+    # most responses come back unfenced; skip the regex pass for them
+    cleaned = _RE_FENCE.sub("", text) if "```" in text else text
+    cleaned = cleaned.translate(_CTRL_CHARS_TABLE)
     cleaned = cleaned.strip()
 
     if (cleaned.startswith('"') and cleaned.endswith('"')) or (cleaned.startswith("'") and cleaned.endswith("'")):
         cleaned = cleaned[1:-1]
 
     if cleaned.startswith("{") or cleaned.startswith("["):
+        # fast path: well-formed output parses in a single orjson pass
         try:
-            parsed = json.loads(cleaned)
-            return parsed
-        except Exception:
-            alt = cleaned.replace("'", '"')
-            alt = re.sub(r",\s*([\]\}])", r"\1", alt)
+            return orjson.loads(cleaned)
+        except orjson.JSONDecodeError:
+            pass
+        # slow path: repair single quotes / trailing commas, then fall back to the outermost array
+        alt = _RE_TRAILING_COMMA.sub(r"\1", cleaned.replace("'", '"'))
+        try:
+            return orjson.loads(alt)
+        except orjson.JSONDecodeError:
+            pass
+        match = _RE_JSON_ARRAY.search(cleaned)
+        if match:
             try:
-                parsed = json.loads(alt)
-                return parsed
-            except Exception:
-                match = re.search(r"($begin:math:display$.*$end:math:display$)", cleaned, re.DOTALL)
-                if match:
-                    try:
-                        parsed = json.loads(match.group(1))
-                        return parsed
-                    except Exception:
-                        pass
+                return orjson.loads(match.group(1))
+            except orjson.JSONDecodeError:
+                pass
     raise ValueError("Failed to parse model output as JSON. Raw output (first 1000 chars):\n" + (cleaned[:1000] if cleaned else ""))
 
 # ---------------------------
 # GenAI wrapper (async-friendly)
 # ---------------------------
-async def generate_questions_from_text(context_text: str, max_questions: int = 10) -> Dict[str, Any]:
+_QUESTIONS_PROMPT = (
+    "Generate up to {n} multiple-choice questions with four options and exactly one correct answer "
+    "for the following content. Return ONLY a JSON array of objects (no extra commentary). "
+    "Each object should have the keys: question, options (array of 4 strings), correct_answer (string).\n\n"
+    "Example output format:\n"
+    '[{{\"question\":\"Q?\",\"options\":[\"A\",\"B\",\"C\",\"D\"],\"correct_answer\":\"A\"}}]\n\n'
+    "Content:\n\n{content}"
+)
+
+_genai_client = None
+_genai_client_lock = threading.Lock()
+
+def get_genai_client():
     """
-    Uses google.genai if available. Returns dict {"message":..., "data":[{question...}]}
-    If genai not configured, raises RuntimeError.
+    Process-wide genai.Client, built on first use: client setup does credential lookup and
+    creates an HTTP session, which is wasted work to repeat per request.
     """
+    global _genai_client
     if genai is None:
         raise RuntimeError("GenAI client not available; install/configure google.genai or mock generation")
+    with _genai_client_lock:
+        if _genai_client is None:
+            _genai_client = genai.Client()
+        return _genai_client
+
+@lru_cache(maxsize=256)
+def _cached_generation(content_hash: str, max_questions: int) -> bytes:
+    """
+    Stored generation for this content as orjson bytes (callers get a fresh copy on every hit).
+    Raises LookupError on a miss so misses aren't memoized; entries never change once written.
+    """
+    session = SessionLocal()
+    try:
+        data = session.query(GenerationCache.data).filter(
+            GenerationCache.content_hash == content_hash,
+            GenerationCache.max_questions == max_questions,
+        ).scalar()
+    finally:
+        session.close()
+    if data is None:
+        raise LookupError(content_hash)
+    return orjson.dumps(data)
+
+def _store_generation(content_hash: str, max_questions: int, data: List[Dict[str, Any]]) -> None:
+    session = SessionLocal()
+    try:
+        # concurrent uploads of the same PDF may both miss; first writer wins
+        session.execute(
+            sqlite_insert(GenerationCache)
+            .values(content_hash=content_hash, max_questions=max_questions, data=data)
+            .on_conflict_do_nothing()
+        )
+        session.commit()
+    finally:
+        session.close()
+
+def _passes_validation(questions: List[Dict[str, Any]]) -> bool:
+    try:
+        QuizCreateSchema(questions=questions)
+    except ValidationError:
+        return False
+    return True
+
+async def generate_questions_from_text(context_text: str, max_questions: int = 10) -> Dict[str, Any]:
+    """
+    Uses google.genai if available. Returns dict {"message":..., "data":[{question...}]}
+    Results are cached by (sha256(context_text), max_questions), so re-uploading the same
+    PDF skips the model call. If genai not configured (and no cached result), raises RuntimeError.
+    """
+    content_hash = hashlib.sha256(context_text.encode("utf-8"), usedforsecurity=False).hexdigest()
+    # the cache is best-effort: a failed lookup (e.g. "database is locked") is just a miss
+    try:
+        cached = await asyncio.to_thread(_cached_generation, content_hash, max_questions)
+        return {"message": "Questions generated", "data": orjson.loads(cached)}
+    except LookupError:
+        pass
+    except Exception as e:
+        print("Generation cache lookup failed, calling the model:", e)
 
-    client = genai.Client()
-    prompt = (
-        "Generate up to {n} multiple-choice questions with four options and exactly one correct answer "
-        "for the following content. Return ONLY a JSON array of objects (no extra commentary). "
-        "Each object should have the keys: question, options (array of 4 strings), correct_answer (string).\n\n"
-        "Example output format:\n"
-        '[{{\"question\":\"Q?\",\"options\":[\"A\",\"B\",\"C\",\"D\"],\"correct_answer\":\"A\"}}]\n\n'
-        "Content:\n\n{content}"
-    ).format(n=max_questions, content=context_text)
+    client = get_genai_client()
+    prompt = _QUESTIONS_PROMPT.format(n=max_questions, content=context_text)
 
     try:
         model_name = "models/gemini-flash-latest"
@@ -195,10 +449,15 @@ async def generate_questions_from_text(context_text: str, max_questions: int = 1
         for item in parsed:
             if not isinstance(item, dict):
                 continue
+            # first truthy alias wins; bail out as soon as a required field is missing
             q = item.get("question") or item.get("q") or item.get("prompt")
+            if not q:
+                continue
             opts = item.get("options") or item.get("choices") or item.get("answers")
+            if not isinstance(opts, list) or len(opts) != 4:
+                continue
             correct = item.get("correct_answer") or item.get("answer") or item.get("correct")
-            if not q or not isinstance(opts, list) or len(opts) != 4 or not correct:
+            if not correct:
                 continue
             normalized.append({
                 "question": q.strip(),
@@ -208,6 +467,14 @@ async def generate_questions_from_text(context_text: str, max_questions: int = 1
             if len(normalized) >= max_questions:
                 break
 
+        # only cache generations that will pass validation on save (e.g. a correct_answer of "B"
+        # instead of an option text would otherwise be replayed forever), so a bad or empty
+        # generation can be retried; a failed write must not throw away a good (and billed) response
+        if normalized and _passes_validation(normalized):
+            try:
+                await asyncio.to_thread(_store_generation, content_hash, max_questions, normalized)
+            except Exception as e:
+                print("Generation cache write failed:", e)
         return {"message": "Questions generated", "data": normalized}
     except Exception as e:
         raise RuntimeError(f"Error generating questions: {str(e)}")
@@ -215,39 +482,53 @@ async def generate_questions_from_text(context_text: str, max_questions: int = 1
 # ---------------------------
 # Fingerprint helper & DB helpers
 # ---------------------------
+def _canon(obj) -> bytes:
+    """
+    Canonical JSON bytes (sorted keys, compact, UTF-8) via orjson. Same bytes as
+    json.dumps(sort_keys=True, ensure_ascii=False, separators=(',', ':')), so stored fingerprints stay valid.
+    """
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
 def _questions_fingerprint(questions: List[Dict[str, Any]]) -> str:
     """
     Deterministic fingerprint for a question list.
     Uses JSON with sorted keys to get a stable representation, then sha256.
     """
-    normalized = json.dumps(questions, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
-    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    return hashlib.sha256(_canon(questions), usedforsecurity=False).hexdigest()
+
+def _json_fingerprint(obj) -> str:
+    """
+    sha256 hex of the canonical JSON of a stored Result field (None -> b"null"), so equality
+    is a string compare instead of a JSON round-trip. Values orjson can't serialize fall back to str().
+    """
+    try:
+        data = _canon(obj)
+    except Exception:
+        data = str(obj).encode("utf-8")
+    return hashlib.sha256(data, usedforsecurity=False).hexdigest()
 
 def save_quiz_to_db_sync(title: str, questions: List[Dict[str, Any]]) -> int:
     """
     Save quiz to DB, but avoid inserting duplicates:
-    - compute fingerprint of questions; if an existing Quiz has same fingerprint,
-      return that existing id instead of inserting a new row.
+    - fingerprint is UNIQUE, so one INSERT ... ON CONFLICT(fingerprint) DO UPDATE ... RETURNING id
+      either inserts the quiz or returns the existing row's id (no SELECT-then-INSERT race).
+    - on conflict, the existing title is replaced only if it is generic.
     """
     session = SessionLocal()
     try:
         fp = _questions_fingerprint(questions)
 
-        # look for existing quiz with same fingerprint
-        existing = session.query(Quiz).filter(Quiz.fingerprint == fp).first()
-        if existing:
-            # optionally update title if current title is generic
-            if title and (existing.title in (None, "", "Uploaded Quiz")) and title != existing.title:
-                existing.title = title
-                session.commit()
-            return existing.id
-
-        # create new quiz row
-        q = Quiz(title=title, questions=questions, fingerprint=fp)
-        session.add(q)
+        stmt = sqlite_insert(Quiz).values(
+            title=title, questions=questions, fingerprint=fp, question_count=len(questions)
+        )
+        generic_title = or_(Quiz.title.is_(None), Quiz.title.in_(("", "Uploaded Quiz")))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Quiz.fingerprint],
+            set_={"title": case((and_(generic_title, stmt.excluded.title != ""), stmt.excluded.title), else_=Quiz.title)},
+        ).returning(Quiz.id)
+        quiz_id = session.execute(stmt).scalar_one()
         session.commit()
-        session.refresh(q)
-        return q.id
+        return quiz_id
     finally:
         session.close()
 
@@ -255,22 +536,46 @@ async def save_questions_and_db_async(title: str, questions: List[Dict[str, Any]
     # validate first (Pydantic)
     quiz_in = QuizCreateSchema(title=title, questions=questions)
 
+    # dump once; shared by the file write and the DB insert
+    payload = [q.model_dump() for q in quiz_in.questions]
+
     # write questions.json atomically (async)
     tmp_file = QUESTIONS_FILE.with_suffix(".tmp")
-    async with aiofiles.open(tmp_file, "w", encoding="utf-8") as f:
-        await f.write(json.dumps([q.dict() for q in quiz_in.questions], ensure_ascii=False, indent=2))
+    # orjson's C indenter emits UTF-8 bytes directly; same layout as json.dumps(indent=2)
+    async with aiofiles.open(tmp_file, "wb") as f:
+        await f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
 
-    # move file synchronously via executor
-    loop = __import__("asyncio").get_event_loop()
-    await loop.run_in_executor(executor, shutil.move, str(tmp_file), str(QUESTIONS_FILE))
+    # same-directory rename: a single atomic syscall, fine to do on the event loop
+    os.replace(tmp_file, QUESTIONS_FILE)
 
-    # persist to DB in executor (with dedupe)
-    quiz_id = await loop.run_in_executor(executor, save_quiz_to_db_sync, quiz_in.title, [q.dict() for q in quiz_in.questions])
+    # persist to DB off the event loop (with dedupe)
+    quiz_id = await asyncio.to_thread(save_quiz_to_db_sync, quiz_in.title, payload)
     return QuizOutSchema(id=quiz_id, title=quiz_in.title, questions=quiz_in.questions, created_at=datetime.datetime.utcnow())
 
 # ---------------------------
 # Result persistence helpers
 # ---------------------------
+def make_user_key(u) -> str:
+    """
+    Normalized user identifier stored in Result.user_key: email, then name, then raw,
+    trimmed and lowercased.
+    """
+    if not u:
+        return ""
+    # exact type checks for the common shapes; anything else goes through str()
+    if type(u) is dict:
+        return (u.get("email") or u.get("name") or u.get("raw") or "").strip().lower()
+    if type(u) is str:
+        if u[:1] != "{":
+            # cannot be a JSON object: skip the parse attempt
+            return u.strip().lower()
+        try:
+            d = orjson.loads(u)
+        except orjson.JSONDecodeError:
+            return u.strip().lower()
+        return (d.get("email") or d.get("name") or d.get("raw") or "").strip().lower()
+    return str(u).strip().lower()
+
 # replace the existing save_result_sync with the following in backend/services.py
 
 def save_result_sync(quiz_id: Optional[int], score: int, total: int, answers: List[Dict[str, Any]], user: Optional[Dict[str,Any]] = None, dedupe_window_seconds: int = 15) -> Dict[str, Any]:
@@ -284,20 +589,21 @@ def save_result_sync(quiz_id: Optional[int], score: int, total: int, answers: Li
         # normalize user to a dict or None
         u = user if (user is None or isinstance(user, dict)) else {"raw": str(user)}
 
-        # defensively stringify answers for comparison
-        try:
-            answers_norm = json.dumps(answers, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
-        except Exception:
-            # fallback: use str()
-            answers_norm = str(answers)
+        # fingerprints are stored on the row, so the duplicate check is a plain column match in SQL
+        answers_fp = _json_fingerprint(answers)
+        user_fp = _json_fingerprint(u)
 
         # compute time cutoff for duplicate detection
         cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=dedupe_window_seconds)
 
-        # Query candidates: same quiz_id, score, total, created recently
-        query = session.query(Result).filter(
+        # same quiz_id, score, total, answers, user, created recently
+        # only id/created_at are read back: answers/user are known to match the inputs by fingerprint,
+        # so the JSON columns are never fetched or decoded on a hit
+        query = session.query(Result.id, Result.created_at).filter(
             Result.score == score,
             Result.total == total,
+            Result.answers_fingerprint == answers_fp,
+            Result.user_fingerprint == user_fp,
             Result.created_at >= cutoff
         )
         if quiz_id is None:
@@ -305,67 +611,36 @@ def save_result_sync(quiz_id: Optional[int], score: int, total: int, answers: Li
         else:
             query = query.filter(Result.quiz_id == quiz_id)
 
-        candidates = query.order_by(Result.created_at.desc()).all()
-
-        # compare candidates deeply (answers + user)
-        for cand in candidates:
-            # compare answers
-            cand_answers = cand.answers
-            try:
-                cand_answers_norm = json.dumps(cand_answers, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
-            except Exception:
-                cand_answers_norm = str(cand_answers)
-
-            if cand_answers_norm != answers_norm:
-                continue
-
-            # compare user (both may be dict or None or string)
-            cand_user = cand.user
-            # normalize cand_user to dict if JSON string
-            if isinstance(cand_user, str):
-                try:
-                    cand_user_norm = json.loads(cand_user)
-                except Exception:
-                    cand_user_norm = {"raw": cand_user}
-            else:
-                cand_user_norm = cand_user
-
-            # compare as JSON strings (robust)
-            try:
-                cand_user_str = json.dumps(cand_user_norm, sort_keys=True, ensure_ascii=False, separators=(',', ':')) if cand_user_norm is not None else "null"
-                user_str = json.dumps(u, sort_keys=True, ensure_ascii=False, separators=(',', ':')) if u is not None else "null"
-            except Exception:
-                cand_user_str = str(cand_user_norm)
-                user_str = str(u)
-
-            if cand_user_str != user_str:
-                continue
-
-            # If we reached here, it's a matching recent attempt: return existing
+        cand = query.order_by(Result.created_at.desc()).first()
+        if cand:
+            # matching recent attempt: return existing
             return {
                 "id": cand.id,
-                "quiz_id": cand.quiz_id,
-                "score": cand.score,
-                "total": cand.total,
-                "answers": cand.answers,
-                "user": cand.user,
+                "quiz_id": quiz_id,
+                "score": score,
+                "total": total,
+                "answers": answers,
+                "user": u,
                 "created_at": cand.created_at.isoformat() if cand.created_at else None,
                 "note": "returned existing result (deduped)"
             }
 
-        # no duplicate found -> insert new row
-        r = Result(quiz_id=quiz_id, score=score, total=total, answers=answers, user=u)
-        session.add(r)
+        # no duplicate found -> Core INSERT ... RETURNING: no unit-of-work flush or refresh SELECT
+        row = session.execute(
+            insert(Result).values(
+                quiz_id=quiz_id, score=score, total=total, answers=answers, user=u, user_key=make_user_key(u),
+                answers_fingerprint=answers_fp, user_fingerprint=user_fp
+            ).returning(Result.id, Result.created_at)
+        ).one()
         session.commit()
-        session.refresh(r)
         return {
-            "id": r.id,
-            "quiz_id": r.quiz_id,
-            "score": r.score,
-            "total": r.total,
-            "answers": r.answers,
-            "user": r.user,
-            "created_at": r.created_at.isoformat() if r.created_at else None
+            "id": row.id,
+            "quiz_id": quiz_id,
+            "score": score,
+            "total": total,
+            "answers": answers,
+            "user": u,
+            "created_at": row.created_at.isoformat() if row.created_at else None
         }
     finally:
         session.close()